@@ -0,0 +1,220 @@
+"""
+Motor analítico em memória: tabelas colunares (NumPy) para os relatórios de produtividade.
+
+Cada tabela guarda uma linha por fato (item check-in concluído, produto instalado) em arrays
+contíguos: dimensões (instalador, job, família...) como códigos int32 de um dicionário, medidas
+(m², minutos) e timestamps (segundos desde a época, NaN quando ausentes) como float64.
+As consultas montam máscaras booleanas e agrupam com np.unique/np.bincount, sem criar um dict por linha.
+
+Não conhece o MongoDB: quem carrega e atualiza as tabelas é o server.py.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class DictionaryEncoder:
+    """Codifica valores (str, int, None...) como inteiros densos, na ordem em que aparecem"""
+
+    def __init__(self):
+        self.values: list = []
+        self._codes: dict = {}
+
+    def encode(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value) -> int:
+        """Código de um valor já visto; -1 se nunca apareceu (não casa com nenhuma linha)"""
+        return self._codes.get(value, -1)
+
+    def decode(self, codes: Iterable[int]) -> list:
+        values = self.values
+        return [values[code] for code in codes]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ColumnarTable:
+    """
+    Tabela colunar de inserção, com remoção lógica (máscara alive) e crescimento geométrico dos arrays.
+    `columns` mapeia nome -> dtype das medidas; as colunas de `encoded` recebem os valores brutos e
+    guardam códigos int32. Cada linha tem um id (ex.: id do documento), usado para evitar duplicatas
+    e para remover.
+    """
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, columns: Dict[str, object], encoded: Sequence[str] = ()):
+        self.dtypes = {name: np.dtype(np.int32) for name in encoded}
+        self.dtypes.update({name: np.dtype(dtype) for name, dtype in columns.items()})
+        self.encoders = {name: DictionaryEncoder() for name in encoded}
+        self._data = {name: np.empty(0, dtype) for name, dtype in self.dtypes.items()}
+        self._alive = np.empty(0, dtype=bool)
+        self.row_ids: list = []
+        self._positions: dict = {}
+        self.size = 0  # linhas gravadas, incluindo as removidas
+
+    def _reserve(self, rows: int):
+        capacity = len(self._alive)
+        if self.size + rows <= capacity:
+            return
+        capacity = max(self.size + rows, 2 * capacity, self.MIN_CAPACITY)
+        for name, array in self._data.items():
+            grown = np.empty(capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._data[name] = grown
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self._alive[:self.size]
+        self._alive = alive
+
+    def extend(self, rows: Iterable[Tuple[object, dict]]) -> int:
+        """Acrescenta linhas (row_id, {coluna: valor}); ids já presentes são ignorados. Retorna quantas entraram."""
+        batch, seen = [], set()
+        for row_id, row in rows:
+            if row_id in self._positions or row_id in seen:
+                continue
+            seen.add(row_id)
+            batch.append((row_id, row))
+        if not batch:
+            return 0
+
+        self._reserve(len(batch))
+        start, end = self.size, self.size + len(batch)
+        for name, array in self._data.items():
+            encoder = self.encoders.get(name)
+            if encoder is not None:
+                values = [encoder.encode(row.get(name)) for _, row in batch]
+            else:
+                values = [row.get(name) for _, row in batch]
+                if array.dtype.kind == "f":
+                    values = [np.nan if value is None else value for value in values]
+            array[start:end] = values
+        self._alive[start:end] = True
+        for offset, (row_id, _) in enumerate(batch):
+            self.row_ids.append(row_id)
+            self._positions[row_id] = start + offset
+        self.size = end
+        return len(batch)
+
+    def remove(self, row_id) -> bool:
+        position = self._positions.pop(row_id, None)
+        if position is None:
+            return False
+        self._alive[position] = False
+        return True
+
+    def remove_where(self, column: str, value) -> int:
+        """Remove todas as linhas vivas cujo valor (codificado) em `column` é `value`"""
+        positions = np.flatnonzero(self.alive & (self.column(column) == self.code(column, value)))
+        for position in positions.tolist():
+            self._positions.pop(self.row_ids[position], None)
+        self._alive[positions] = False
+        return len(positions)
+
+    def column(self, name: str) -> np.ndarray:
+        return self._data[name][:self.size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:self.size]
+
+    def code(self, column: str, value) -> int:
+        return self.encoders[column].code(value)
+
+    def decode(self, column: str, codes: Iterable[int]) -> list:
+        return self.encoders[column].decode(codes)
+
+    def ids(self, positions: Iterable[int]) -> list:
+        row_ids = self.row_ids
+        return [row_ids[position] for position in positions]
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def nbytes(self) -> int:
+        """Memória dos arrays (a capacidade reservada, não só as linhas usadas)"""
+        return sum(array.nbytes for array in self._data.values()) + self._alive.nbytes
+
+
+def date_mask(timestamps: np.ndarray, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+    """Linhas com timestamp em [start, end]; linhas sem timestamp (NaN) sempre passam"""
+    mask = np.ones(len(timestamps), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if start is not None:
+            mask &= ~(timestamps < start)
+        if end is not None:
+            mask &= ~(timestamps > end)
+    return mask
+
+
+def _split(values: np.ndarray, counts: np.ndarray) -> List[list]:
+    """Fatia `values` (já ordenados por grupo) em listas de `counts` elementos; listas fatiam bem mais rápido que np.split"""
+    values = values.tolist()
+    ends = np.cumsum(counts).tolist()
+    return [values[end - count:end] for end, count in zip(ends, counts.tolist())]
+
+
+class GroupBy:
+    """
+    Agrupamento das linhas selecionadas (posições `rows`, na ordem da tabela) por uma ou mais
+    colunas de códigos. Os grupos saem ordenados pela chave; first_rows é a primeira linha de cada um.
+    """
+
+    def __init__(self, rows: np.ndarray, *keys: np.ndarray):
+        self.rows = rows
+        if not len(rows):
+            combined = np.empty(0, dtype=np.int64)
+        elif len(keys) == 1:
+            combined = keys[0][rows].astype(np.int64)
+        else:
+            key_rows = tuple(key[rows].astype(np.int64) for key in keys)
+            combined = np.ravel_multi_index(key_rows, tuple(int(key.max()) + 1 for key in key_rows))
+        _, first, self.inverse, self.counts = np.unique(
+            combined, return_index=True, return_inverse=True, return_counts=True
+        )
+        self.inverse = self.inverse.reshape(-1)
+        self.first_rows = rows[first]
+        self.size = len(self.counts)
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Soma de `values` em cada grupo (acumulada na ordem das linhas)"""
+        return np.bincount(self.inverse, weights=values[self.rows], minlength=self.size)
+
+    def distinct(self, codes: np.ndarray) -> List[list]:
+        """Códigos distintos de outra coluna em cada grupo"""
+        if not self.size:
+            return []
+        width = int(codes[self.rows].max()) + 1
+        pairs = np.unique(self.inverse.astype(np.int64) * width + codes[self.rows])
+        groups, values = np.divmod(pairs, width)
+        return _split(values, np.bincount(groups, minlength=self.size))
+
+    def head(self, limit: int) -> List[list]:
+        """Até `limit` primeiras linhas (posições na tabela) de cada grupo, na ordem da tabela"""
+        if not self.size:
+            return []
+        order = np.argsort(self.inverse, kind="stable")
+        starts = np.cumsum(self.counts) - self.counts
+        rank = np.arange(len(order)) - np.repeat(starts, self.counts)
+        return _split(self.rows[order[rank < limit]], np.minimum(self.counts, limit))
+
+    def percentiles(self, values: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+        """Percentis de `values` em cada grupo (interpolação linear, como np.percentile): grupos × percentis"""
+        result = np.empty((self.size, len(percentiles)))
+        if not self.size:
+            return result
+        group_values = values[self.rows]
+        ordered = group_values[np.lexsort((group_values, self.inverse))]
+        starts = np.cumsum(self.counts) - self.counts
+        for column, percentile in enumerate(percentiles):
+            position = starts + (self.counts - 1) * (percentile / 100)
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            result[:, column] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        return result
@@ -0,0 +1,359 @@
+"""
+Processamento de imagens (compressão das fotos de check-in/checkout).
+
+Fica fora do server.py para que os processos do pool importem apenas o Pillow
+(o pool usa "spawn": os filhos não herdam o loop, as threads nem o cliente do Mongo).
+"""
+
+import asyncio
+import base64
+import logging
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image
+
+
+JPEG_MAX_QUALITY = 85
+JPEG_MIN_QUALITY = 20
+JPEG_MAX_PROBES = 3
+# Sem nenhuma qualidade que caiba ainda, mira um pouco abaixo do alvo; na última sondagem, bem abaixo
+# (é a última chance de evitar JPEG_MIN_QUALITY)
+JPEG_NO_FIT_AIM = 0.9
+JPEG_NO_FIT_LAST_AIM = 0.8
+
+def _encode_jpeg(img: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=optimize)
+    return output.getvalue()
+
+def _jpeg_log_scale(quality: float) -> float:
+    """ln do fator de escala das tabelas de quantização do libjpeg para a qualidade"""
+    return math.log(5000 / quality if quality < 50 else 200 - 2 * quality)
+
+def _jpeg_quality_for_log_scale(log_scale: float) -> float:
+    scale = math.exp(log_scale)
+    return (200 - scale) / 2 if scale <= 100 else 5000 / scale
+
+def choose_jpeg_quality(img: Image.Image, max_bytes: int, max_probes: int = JPEG_MAX_PROBES) -> tuple:
+    """
+    Maior qualidade em [JPEG_MIN_QUALITY, JPEG_MAX_QUALITY] cujo JPEG cabe em max_bytes, com no máximo
+    max_probes codificações rápidas (sem optimize, que só reduz o tamanho); se nenhuma couber, JPEG_MIN_QUALITY
+    (imagens muito ruidosas: o menor arquivo sem reduzir as dimensões, mesmo acima de max_bytes).
+    ln(tamanho) é quase linear em ln(escala da quantização) com inclinação ≈ -1, então cada palpite é uma
+    interpolação nesse espaço: primeiro com a inclinação típica, depois com a secante entre as sondagens
+    que delimitam o intervalo ainda em aberto.
+    Retorna (qualidade, número de sondagens).
+    """
+    sizes = {}
+    quality = JPEG_MAX_QUALITY
+    while True:
+        sizes[quality] = len(_encode_jpeg(img, quality))
+        
+        fitting = [q for q, size in sizes.items() if size <= max_bytes]
+        failing = [q for q, size in sizes.items() if size > max_bytes]
+        best = max(fitting, default=JPEG_MIN_QUALITY - 1)  # maior qualidade que cabe
+        limit = min(failing, default=JPEG_MAX_QUALITY + 1)  # menor qualidade que não cabe
+        if limit - best <= 1 or limit == JPEG_MIN_QUALITY:
+            break
+        if len(sizes) >= max_probes:
+            break
+        
+        slope = -1.0
+        if best in sizes and limit in sizes:
+            measured = (math.log(sizes[limit]) - math.log(sizes[best])) / (_jpeg_log_scale(limit) - _jpeg_log_scale(best))
+            if measured < 0:
+                slope = measured
+        if fitting:
+            aim = max_bytes
+        else:
+            aim = max_bytes * (JPEG_NO_FIT_LAST_AIM if len(sizes) == max_probes - 1 else JPEG_NO_FIT_AIM)
+        reference = limit if limit in sizes else best
+        log_scale = _jpeg_log_scale(reference) + math.log(aim / sizes[reference]) / slope
+        guess = math.floor(_jpeg_quality_for_log_scale(log_scale))
+        quality = max(best + 1, JPEG_MIN_QUALITY, min(limit - 1, guess))
+    
+    return max(best, JPEG_MIN_QUALITY), len(sizes)
+
+# Versões de cada foto de check-in: (nome, lado máximo em px, tamanho máximo em KB), da maior para a menor
+PHOTO_RENDITIONS = (
+    ("full", 1200, 300),    # visualização ampliada / relatórios
+    ("medium", 640, 80),    # cards e pré-visualização
+    ("thumb", 256, 20),     # galerias e listas
+)
+
+def _fit_size(size: tuple, max_dimension: int) -> tuple:
+    """Tamanho que cabe em max_dimension x max_dimension mantendo a proporção (o próprio size se já cabe)"""
+    width, height = size
+    if width <= max_dimension and height <= max_dimension:
+        return size
+    ratio = min(max_dimension / width, max_dimension / height)
+    return (int(width * ratio), int(height * ratio))
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    # Convert to RGB if necessary (handles PNG with transparency, etc.)
+    if img.mode in ('RGBA', 'P', 'LA'):
+        # Create white background for transparent images
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+def _open(source) -> Image.Image:
+    """source: bytes da imagem ou caminho de um arquivo (upload gravado em disco, lido sob demanda pelo Pillow)"""
+    return Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+def _open_for_size(source, largest_size: tuple) -> Image.Image:
+    """Abre a imagem já em RGB; para JPEG, decodifica direto em escala 1/2, 1/4 ou 1/8 (sem passar pela resolução cheia)"""
+    img = _open(source)
+    if img.format == 'JPEG' and largest_size != img.size:
+        img.draft('RGB', largest_size)
+    return _to_rgb(img)
+
+def _resize(img: Image.Image, size: tuple) -> Image.Image:
+    if img.size == size:
+        return img
+    # reducing_gap: redução inteira rápida antes do LANCZOS
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+def compress_image(image_data: bytes, max_size_kb: int = 300, max_dimension: int = 1200) -> tuple:
+    """
+    Redimensiona e comprime uma imagem para JPEG.
+    Retorna (jpeg_bytes, qualidade, número de codificações).
+    """
+    with Image.open(BytesIO(image_data)) as probe:
+        original_size = probe.size
+    new_size = _fit_size(original_size, max_dimension)
+    img = _resize(_open_for_size(image_data, new_size), new_size)
+    if img.size != original_size:
+        logging.info(f"Image resized from {original_size} to {img.size}")
+    
+    # Qualidade escolhida por sondagens rápidas; optimize apenas na codificação final
+    quality, probes = choose_jpeg_quality(img, max_size_kb * 1024)
+    return _encode_jpeg(img, quality, optimize=True), quality, probes + 1
+
+def compress_image_renditions(source, renditions: tuple = PHOTO_RENDITIONS) -> dict:
+    """
+    Todas as versões de uma foto com uma única decodificação: a imagem é aberta (draft) no tamanho da
+    maior versão e cada versão seguinte é reduzida a partir da anterior.
+    source: bytes da imagem ou caminho do arquivo. Retorna {nome: jpeg_bytes}.
+    """
+    with _open(source) as probe:
+        original_size = probe.size
+    targets = sorted(
+        ((name, _fit_size(original_size, max_dimension), max_size_kb) for name, max_dimension, max_size_kb in renditions),
+        key=lambda target: target[1][0] * target[1][1],
+        reverse=True
+    )
+    img = _open_for_size(source, targets[0][1])
+    
+    results = {}
+    for name, size, max_size_kb in targets:
+        img = _resize(img, size)
+        quality, _ = choose_jpeg_quality(img, max_size_kb * 1024)
+        results[name] = _encode_jpeg(img, quality, optimize=True)
+    return results
+
+def compress_image_to_base64(image_data: bytes, max_size_kb: int = 300, max_dimension: int = 1200) -> str:
+    """
+    Compress image and return base64 string.
+    - Resizes image if larger than max_dimension (JPEGs are decoded already downscaled via draft mode)
+    - Compresses to target size (default 300KB), choosing the quality with at most 3 quick encodes
+    - Converts to JPEG format (optimize only on the final encode)
+    """
+    try:
+        output, quality, encodes = compress_image(image_data, max_size_kb, max_dimension)
+        
+        final_size_kb = len(output) / 1024
+        logging.info(f"Image compressed: {len(image_data)/1024:.1f}KB -> {final_size_kb:.1f}KB (quality={quality}, encodes={encodes})")
+        
+        return base64.b64encode(output).decode('utf-8')
+        
+    except Exception as e:
+        logging.error(f"Error compressing image: {str(e)}")
+        # Return original as base64 if compression fails
+        return base64.b64encode(image_data).decode('utf-8')
+
+def compress_base64_image(base64_string: str, max_size_kb: int = 300, max_dimension: int = 1200) -> str:
+    """
+    Compress a base64-encoded image string.
+    Returns compressed base64 string.
+    """
+    if not base64_string:
+        return base64_string
+    
+    try:
+        # Remove data URL prefix if present
+        if ',' in base64_string:
+            base64_string = base64_string.split(',')[1]
+        
+        # Decode base64 to bytes
+        image_data = base64.b64decode(base64_string)
+        original_size_kb = len(image_data) / 1024
+        
+        # Skip compression for small images
+        if original_size_kb <= max_size_kb:
+            logging.info(f"Image already small ({original_size_kb:.1f}KB), skipping compression")
+            return base64_string
+        
+        # Compress the image
+        return compress_image_to_base64(image_data, max_size_kb, max_dimension)
+        
+    except Exception as e:
+        logging.error(f"Error in compress_base64_image: {str(e)}")
+        return base64_string
+
+def compress_image_bytes(image_data: bytes, max_size_kb: int = 300, max_dimension: int = 1200) -> bytes:
+    """
+    Como compress_base64_image, mas de bytes para bytes (sem base64 entre os processos).
+    Imagens já pequenas, ou que falham na compressão, voltam como vieram.
+    """
+    original_size_kb = len(image_data) / 1024
+    if original_size_kb <= max_size_kb:
+        logging.info(f"Image already small ({original_size_kb:.1f}KB), skipping compression")
+        return image_data
+    
+    try:
+        output, quality, encodes = compress_image(image_data, max_size_kb, max_dimension)
+        logging.info(f"Image compressed: {original_size_kb:.1f}KB -> {len(output)/1024:.1f}KB (quality={quality}, encodes={encodes})")
+        return output
+    except Exception as e:
+        logging.error(f"Error compressing image: {str(e)}")
+        return image_data
+
+
+def compress_photo_renditions(source, renditions: tuple = PHOTO_RENDITIONS) -> dict:
+    """
+    compress_image_renditions para o pool (source: bytes ou caminho do arquivo, que só é lido aqui, no
+    processo do pool). A versão "full" segue as regras de compress_image_bytes: uma foto que já cabe no
+    limite é guardada como veio. Se a compressão falhar, devolve só {"full": original}.
+    """
+    def original() -> bytes:
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source)
+        with open(source, "rb") as f:
+            return f.read()
+    
+    full_max_kb = dict((name, max_size_kb) for name, _, max_size_kb in renditions)["full"]
+    source_size = len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+    try:
+        started = time.perf_counter()
+        results = compress_image_renditions(source, renditions)
+    except Exception as e:
+        logging.error(f"Error compressing image: {str(e)}")
+        return {"full": original()}
+    
+    if source_size <= full_max_kb * 1024:
+        results["full"] = original()
+    sizes = ", ".join(f"{name}={len(data)/1024:.1f}KB" for name, data in results.items())
+    logging.info(f"Image renditions: {source_size/1024:.1f}KB -> {sizes} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+    return results
+
+class ImageServiceBusy(Exception):
+    """Fila do serviço de imagens cheia (o chamador deve responder 429)"""
+
+
+class ImageProcessingService:
+    """
+    Executa a compressão de imagens em um ProcessPoolExecutor, fora do loop de eventos.
+    - workers: processos do pool (padrão: número de CPUs)
+    - max_pending: limite de tarefas em execução + na fila; acima disso submit() levanta ImageServiceBusy
+    Mantém métricas de profundidade da fila e de latência (espera na fila + processamento).
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int = 0, latency_window: int = 500):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._executor = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+        self._latencies_ms = deque(maxlen=latency_window)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def check_capacity(self):
+        """ImageServiceBusy se a fila estiver cheia (para recusar antes de preparar a entrada de submit)"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ImageServiceBusy(f"{self.pending} imagens em processamento")
+
+    async def submit(self, func, *args):
+        """Executa func(*args) no pool e devolve o resultado; ImageServiceBusy se a fila estiver cheia"""
+        self.check_capacity()
+        self.start()
+        self.pending += 1
+        self.submitted += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            try:
+                result = await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # Um processo morreu (ex.: OOM com imagem enorme): recria o pool (uma vez por quebra) e tenta de novo
+                if self._executor is executor:
+                    logging.error("Image process pool broken, restarting")
+                    self.shutdown()
+                    self.start()
+                    self.pool_restarts += 1
+                result = await loop.run_in_executor(self._executor, func, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self._latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p):
+            if not latencies:
+                return 0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1)
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "peak_pending": self.peak_pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "pool_restarts": self.pool_restarts,
+            "latency_ms": {
+                "samples": len(latencies),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 1) if latencies else 0
+            }
+        }
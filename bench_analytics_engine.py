@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark of the productivity report on the columnar analytics snapshot (backend/analytics.py)
+against the MongoDB path, on synthetic completed item check-ins. Needs a MongoDB at MONGO_URL
+(default localhost): the data goes into BENCH_DB_NAME (default "instalmonitor_bench"), which is
+dropped before and after the run.
+
+For each size, runs the server's own builders both ways and diffs the responses:
+- build_productivity_report: one $facet aggregation vs productivity_facets_from_snapshot
+- build_productivity_records for the largest installer, job and family groups: $sort/$limit around the
+  $lookup vs the snapshot picking the rows (both fetch the returned rows from Mongo)
+- build_productivity_percentiles per family vs np.percentile over the rows read from Mongo
+Also reports the snapshot load time and memory.
+
+Usage: python bench_analytics_engine.py [max_checkins]
+"""
+
+import asyncio
+import gc
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "instalmonitor_bench")
+os.environ.setdefault("HOLDPRINT_SYNC_ENABLED", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import numpy as np  # noqa: E402
+
+import server  # noqa: E402
+
+DATE_FROM, DATE_TO = "2025-02-01", "2025-05-31"
+REPORT_CASES = [
+    {},
+    {"date_from": DATE_FROM, "date_to": DATE_TO},
+    {"filter_by": "family", "filter_id": "Lona"},
+]
+PERCENTILES = [50, 75, 90]
+RECORDS_LIMIT = 50
+FAMILIES = ["Adesivo", "Lona", "ACM", "Painel", None]
+
+
+async def seed(db, checkins_count, seed=42):
+    """~25 check-ins per installer and ~8 per job, up to 6 items per job"""
+    rng = random.Random(seed)
+    installers = [{"id": f"inst-{i}", "full_name": f"Instalador {i}", "branch": "POA"}
+                  for i in range(max(1, checkins_count // 25))]
+    jobs = []
+    for j in range(max(1, checkins_count // 8)):
+        jobs.append({
+            "id": f"job-{j}",
+            "title": f"Job {j}",
+            "client_name": rng.choice(["", f"Cliente {j % 300}"]),
+            "holdprint_data": {"customerName": f"HP {j % 300}"},
+            "area_m2": rng.choice([None, round(rng.uniform(5, 400), 2)]),
+            "products_with_area": [
+                {"name": f"Item {j}-{k}", "family_name": rng.choice(FAMILIES),
+                 "total_area_m2": rng.choice([None, round(rng.uniform(0.5, 80), 4)])}
+                for k in range(rng.randint(1, 6))
+            ]
+        })
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    checkins = []
+    for n in range(checkins_count):
+        job = rng.choice(jobs)
+        checkin_at = base + timedelta(seconds=rng.randint(0, 180 * 24 * 3600))
+        duration = rng.randint(10, 480)
+        checkin = {
+            "id": f"ic-{n}",
+            "job_id": job["id"],
+            "item_index": rng.randrange(len(job["products_with_area"])),
+            "installer_id": rng.choice(installers)["id"],
+            "status": "completed",
+            "checkin_at": checkin_at.isoformat(),
+            "checkout_at": (checkin_at + timedelta(minutes=duration)).isoformat(),
+            "duration_minutes": duration,
+            "total_pause_minutes": 0,
+        }
+        if rng.random() < 0.9:
+            checkin["net_duration_minutes"] = duration - rng.randint(0, 10)
+        checkins.append(checkin)
+
+    await db.installers.insert_many(installers)
+    await db.jobs.insert_many(jobs)
+    for start in range(0, len(checkins), 10000):
+        await db.item_checkins.insert_many(checkins[start:start + 10000])
+    for collection, keys in (("jobs", [("id", 1)]), ("item_checkins", [("installer_id", 1), ("checkin_at", -1), ("id", -1)]),
+                             ("item_checkins", [("job_id", 1), ("checkin_at", -1), ("id", -1)]),
+                             ("item_checkins", [("status", 1), ("checkin_at", 1)]), ("item_checkins", [("id", 1)])):
+        await db[collection].create_index(keys)
+
+
+def norm(value):
+    """Order-insensitive lists (sets and sort ties) and rounded floats"""
+    if isinstance(value, dict):
+        return {key: norm(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return sorted((norm(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+async def timed(func, *args, repeat=3):
+    """Best of `repeat` runs with the garbage collector off (as timeit does)."""
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = await func(*args)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def use_snapshot(snapshot):
+    """Points the builders at `snapshot` (an empty one makes them read MongoDB)"""
+    server.analytics_snapshot = snapshot
+
+
+async def report_both_ways(snapshot, empty):
+    mongo_time = snapshot_time = 0
+    mismatches = 0
+    for case in REPORT_CASES:
+        args = (case.get("filter_by"), case.get("filter_id"), case.get("date_from"), case.get("date_to"))
+        use_snapshot(empty)
+        elapsed, expected = await timed(server.build_productivity_report, *args)
+        mongo_time += elapsed
+        use_snapshot(snapshot)
+        elapsed, actual = await timed(server.build_productivity_report, *args)
+        snapshot_time += elapsed
+        mismatches += norm(expected) != norm(actual)
+    return mongo_time, snapshot_time, mismatches
+
+
+async def records_both_ways(snapshot, empty, report):
+    """Records of the largest installer, job and family groups"""
+    groups = [
+        ("installer", max(report["by_installer"], key=lambda group: group["items_count"])["installer_id"]),
+        ("job", max(report["by_job"], key=lambda group: group["items_count"])["job_id"]),
+        ("family", max(report["by_family"], key=lambda group: group["items_count"])["family_name"]),
+    ]
+    mongo_time = snapshot_time = 0
+    mismatches = 0
+    for group_by, group_id in groups:
+        args = (group_by, group_id, None, None, None, None, None, RECORDS_LIMIT)
+        use_snapshot(empty)
+        elapsed, expected = await timed(server.build_productivity_records, *args)
+        mongo_time += elapsed
+        use_snapshot(snapshot)
+        elapsed, actual = await timed(server.build_productivity_records, *args)
+        snapshot_time += elapsed
+        mismatches += expected != actual
+    return mongo_time, snapshot_time, mismatches
+
+
+async def mongo_percentiles():
+    """Per-family m²/h and min/m² percentiles over the report rows read from MongoDB"""
+    by_family = {}
+    pipeline = [{"$match": {"status": "completed"}}, *server.PRODUCTIVITY_ROW_STAGES]
+    async for row in server.db.item_checkins.aggregate(pipeline):
+        m2, minutes = row["m2_api"], row["duration_minutes"]
+        if m2 > 0 and minutes > 0:
+            by_family.setdefault(row["family_name"], []).append((m2 / (minutes / 60), minutes / m2))
+    result = {}
+    for family, values in by_family.items():
+        productivity, minutes_per_m2 = np.array(values).T
+        result[family] = (
+            len(values),
+            np.percentile(productivity, PERCENTILES).round(2).tolist(),
+            np.percentile(minutes_per_m2, PERCENTILES).round(2).tolist(),
+        )
+    return result
+
+
+async def snapshot_percentiles():
+    response = await server.build_productivity_percentiles("family", PERCENTILES, None, None)
+    return {
+        group["key"]: (group["executions"], list(group["productivity_m2_h"].values()), list(group["minutes_per_m2"].values()))
+        for group in response["groups"]
+    }
+
+
+def same_percentiles(expected, actual):
+    def close(a, b):
+        return all(math.isclose(x, y, abs_tol=0.011) for x, y in zip(a, b))
+    return expected.keys() == actual.keys() and all(
+        expected[key][0] == actual[key][0] and close(expected[key][1], actual[key][1]) and close(expected[key][2], actual[key][2])
+        for key in expected
+    )
+
+
+async def run_size(size):
+    await server.client.drop_database(server.db.name)
+    await seed(server.db, size)
+
+    snapshot = server.ProductivitySnapshot(max_age_seconds=float("inf"))
+    empty = server.ProductivitySnapshot(max_age_seconds=float("inf"))
+    load_time, _ = await timed(snapshot.load, repeat=1)
+
+    report_mongo, report_snapshot, mismatches = await report_both_ways(snapshot, empty)
+    use_snapshot(snapshot)
+    report = await server.build_productivity_report(None, None, None, None)
+    records_mongo, records_snapshot, records_mismatches = await records_both_ways(snapshot, empty, report)
+    mismatches += records_mismatches
+
+    pct_mongo, expected = await timed(mongo_percentiles)
+    use_snapshot(snapshot)
+    pct_snapshot, actual = await timed(snapshot_percentiles)
+    mismatches += not same_percentiles(expected, actual)
+
+    print(f"{size:>9} | {load_time * 1000:>6.0f}ms {snapshot.items.nbytes() / 2**20:>6.1f}MB | "
+          f"{report_mongo * 1000:>8.1f}ms {report_snapshot * 1000:>8.1f}ms {report_mongo / report_snapshot:>6.1f}x | "
+          f"{records_mongo * 1000:>7.1f}ms {records_snapshot * 1000:>7.1f}ms | "
+          f"{pct_mongo * 1000:>8.1f}ms {pct_snapshot * 1000:>7.1f}ms")
+    return mismatches
+
+
+async def main():
+    max_checkins = int(sys.argv[1]) if len(sys.argv) > 1 else 80000
+    sizes = []
+    size = 10000
+    while size <= max_checkins:
+        sizes.append(size)
+        size *= 2
+
+    print("=" * 108)
+    print("ANALYTICS SNAPSHOT BENCHMARK — MongoDB vs snapshot, same builders (report, group records, percentiles)")
+    print("=" * 108)
+    print(f"{'check-ins':>9} | {'load':>8} {'memory':>8} | {'report mongo':>12} {'snapshot':>10} {'speedup':>7} | "
+          f"{'records mongo/snap':>19} | {'pct mongo':>10} {'snapshot':>9}")
+
+    mismatches = 0
+    try:
+        for size in sizes:
+            mismatches += await run_size(size)
+    finally:
+        await server.client.drop_database(server.db.name)
+
+    print("-" * 108)
+    print(f"report = {len(REPORT_CASES)} filter combinations; records = largest installer, job and family (limit {RECORDS_LIMIT})")
+    print(f"mismatches vs MongoDB: {mismatches}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for check-in photo compression (no server needed).
+Extends test_large_image_compression.py: same very large noisy image, plus
+phone-sized JPEGs, a smooth photo-like image and a transparent PNG.
+
+Compares the previous compressor (quality loop from 85 in steps of 5, all
+encodes with optimize=True, full-resolution decode) with the current one, then
+the one-pass rendition pipeline (full/medium/thumb) with three separate
+compressions.
+
+Usage: python bench_image_compression.py [repeat]
+"""
+
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import image_processing  # noqa: E402
+
+MAX_SIZE_KB = 300
+MAX_DIMENSION = 1200
+
+
+def legacy_compress_image(image_data, max_size_kb=MAX_SIZE_KB, max_dimension=MAX_DIMENSION):
+    """Previous compressor; returns (jpeg_bytes, quality, encodes)"""
+    img = Image.open(BytesIO(image_data))
+    if img.mode in ('RGBA', 'P', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if img.width > max_dimension or img.height > max_dimension:
+        ratio = min(max_dimension / img.width, max_dimension / img.height)
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+
+    quality = 85
+    encodes = 0
+    while quality >= 20:
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        encodes += 1
+        if len(output.getvalue()) / 1024 <= max_size_kb:
+            break
+        quality -= 5
+    return output.getvalue(), max(quality, 20), encodes
+
+
+def current_compress_image(image_data, max_size_kb=MAX_SIZE_KB, max_dimension=MAX_DIMENSION):
+    """Current compressor; returns (jpeg_bytes, quality, encodes)"""
+    return image_processing.compress_image(image_data, max_size_kb, max_dimension)
+
+
+def noisy_blocks(width, height, seed=42):
+    """Same pattern as create_very_large_image(): 5x5 random colour blocks with ±30 per-pixel noise"""
+    rng = random.Random(seed)
+    blocks = Image.frombytes("RGB", (width // 5, height // 5), rng.randbytes((width // 5) * (height // 5) * 3))
+    img = blocks.resize((width, height), Image.Resampling.NEAREST)
+    noise = Image.merge("RGB", [Image.effect_noise((width, height), 30) for _ in range(3)])
+    return ImageChops.add(img, noise, scale=1.0, offset=-128)
+
+
+def photo_like(width, height):
+    """Smooth gradients and shapes with mild sensor noise (typical facade/vehicle photo)"""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    img = ImageChops.multiply(img, Image.effect_mandelbrot((width, height), (-2, -1.2, 1, 1.2), 60).convert("RGB"))
+    draw = ImageDraw.Draw(img)
+    rng = random.Random(7)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle((x, y, x + rng.randrange(50, 600), y + rng.randrange(50, 400)),
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    img = img.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.merge("RGB", [Image.effect_noise((width, height), 8) for _ in range(3)])
+    return ImageChops.add(img, noise, scale=1.0, offset=-128)
+
+
+def encode(img, fmt, **params):
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def build_corpus():
+    corpus = []
+    big_noisy = noisy_blocks(5000, 4000)
+    corpus.append(("noisy 5000x4000 PNG (test_large_image_compression)", encode(big_noisy, "PNG", compress_level=0)))
+    corpus.append(("noisy 4000x3000 JPEG q95 (12 MP phone)", encode(big_noisy.resize((4000, 3000)), "JPEG", quality=95)))
+    corpus.append(("photo-like 4032x3024 JPEG q92", encode(photo_like(4032, 3024), "JPEG", quality=92)))
+    corpus.append(("photo-like 2592x1944 JPEG q90 (5 MP)", encode(photo_like(2592, 1944), "JPEG", quality=90)))
+    rgba = photo_like(2000, 3000).convert("RGBA")
+    rgba.putalpha(Image.linear_gradient("L").resize((2000, 3000)))
+    corpus.append(("photo-like 2000x3000 PNG with alpha", encode(rgba, "PNG")))
+    return corpus
+
+
+def timed(func, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print("=" * 100)
+    print(f"IMAGE COMPRESSION BENCHMARK (target {MAX_SIZE_KB}KB, max {MAX_DIMENSION}px, best of {repeat})")
+    print("=" * 100)
+    print(f"{'image':<52} {'input':>9} | {'legacy':>22} | {'current':>22} | speedup")
+
+    ok = True
+    total_legacy = total_current = 0.0
+    for label, data in build_corpus():
+        legacy_time, (legacy_out, legacy_q, legacy_encodes) = timed(legacy_compress_image, data, repeat)
+        current_time, (current_out, current_q, current_encodes) = timed(current_compress_image, data, repeat)
+        total_legacy += legacy_time
+        total_current += current_time
+
+        Image.open(BytesIO(current_out)).verify()
+        if len(current_out) > MAX_SIZE_KB * 1024 >= len(legacy_out):
+            ok = False
+
+        print(
+            f"{label:<52} {len(data) / 1024:>7.0f}KB | "
+            f"{legacy_time * 1000:>6.0f}ms q{legacy_q:<2} {legacy_encodes:>2}enc {len(legacy_out) / 1024:>4.0f}KB | "
+            f"{current_time * 1000:>6.0f}ms q{current_q:<2} {current_encodes:>2}enc {len(current_out) / 1024:>4.0f}KB | "
+            f"{legacy_time / current_time:>5.1f}x"
+        )
+
+    print("-" * 100)
+    print(f"total: legacy {total_legacy:.2f}s, current {total_current:.2f}s ({total_legacy / total_current:.1f}x)")
+
+    print()
+    renditions = image_processing.PHOTO_RENDITIONS
+    print("RENDITIONS " + ", ".join(f"{name} {dim}px/{kb}KB" for name, dim, kb in renditions))
+    print(f"{'image':<52} {'separate':>9} | {'one pass':>9} | {'sizes':<32} | speedup")
+    for label, data in build_corpus():
+        separate_time, _ = timed(
+            lambda d: [image_processing.compress_image(d, kb, dim) for _, dim, kb in renditions], data, repeat
+        )
+        one_pass_time, result = timed(image_processing.compress_image_renditions, data, repeat)
+        for name, _, kb in renditions:
+            Image.open(BytesIO(result[name])).verify()
+            ok = ok and len(result[name]) <= kb * 1024
+        sizes = " ".join(f"{name}={len(result[name]) / 1024:.0f}KB" for name, _, _ in renditions)
+        print(
+            f"{label:<52} {separate_time * 1000:>7.0f}ms | {one_pass_time * 1000:>7.0f}ms | {sizes:<32} | "
+            f"{separate_time / one_pass_time:>5.1f}x"
+        )
+
+    print("-" * 100)
+    print("✅ all outputs within target" if ok else "❌ an output missed its size target")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the per-installer productivity report (/reports/by-installer) on
+synthetic datasets of growing size (installers grow with the check-ins). Runs offline.
+
+Compares the previous report (one filter over all item check-ins per installer, plus one per
+job worked) with the single grouped pass (installer_job_groups + installer_report_from_groups).
+Time per check-in should stay roughly flat for the grouped pass (only cache effects as the
+working set grows) and grow with the installer count for the previous one.
+
+Usage: python bench_installer_report.py [max_checkins]
+"""
+
+import gc
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("HOLDPRINT_SYNC_ENABLED", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+
+
+def legacy_installer_report(installers, item_checkins, jobs_map):
+    """Report as it was before the grouped pass (installers × check-ins)."""
+    installer_report = []
+    for installer in installers:
+        installer_id = installer["id"]
+        installer_checkins = [c for c in item_checkins if c.get("installer_id") == installer_id]
+        completed_count = len(installer_checkins)
+
+        total_net_duration_min = 0
+        total_m2_installed = 0
+        for checkin in installer_checkins:
+            net_minutes = checkin.get("net_duration_minutes") or checkin.get("duration_minutes") or 0
+            total_net_duration_min += net_minutes
+            job = jobs_map.get(checkin.get("job_id"))
+            if job:
+                products = job.get("products_with_area", [])
+                item_index = checkin.get("item_index", 0)
+                if item_index < len(products):
+                    total_m2_installed += products[item_index].get("total_area_m2", 0) or 0
+
+        job_ids = set(c.get("job_id") for c in installer_checkins if c.get("job_id"))
+        jobs_details = []
+        for job_id in job_ids:
+            job = jobs_map.get(job_id)
+            if job:
+                job_item_checkins = [c for c in installer_checkins if c.get("job_id") == job_id]
+                job_net_duration = sum(c.get("net_duration_minutes") or c.get("duration_minutes") or 0 for c in job_item_checkins)
+                job_m2_installed = 0
+                products = job.get("products_with_area", [])
+                for checkin in job_item_checkins:
+                    item_index = checkin.get("item_index", 0)
+                    if item_index < len(products):
+                        job_m2_installed += products[item_index].get("total_area_m2", 0) or 0
+                jobs_details.append(server._installer_job_detail(job, job_net_duration, job_m2_installed, len(job_item_checkins)))
+
+        installer_report.append(server._installer_report_row(
+            installer, completed_count, total_net_duration_min, total_m2_installed, len(job_ids), jobs_details
+        ))
+    return installer_report
+
+
+def same_report(legacy, grouped):
+    """Equal metrics and job details; jobs tied on m2_installed may swap places at the top-20 cut."""
+    for old, new in zip(legacy, grouped):
+        if old["installer_id"] != new["installer_id"] or old["metrics"] != new["metrics"]:
+            return False
+        if [job["m2_installed"] for job in old["jobs"]] != [job["m2_installed"] for job in new["jobs"]]:
+            return False
+        old_jobs = {job["job_id"]: job for job in old["jobs"]}
+        if any(old_jobs.get(job["job_id"], job) != job for job in new["jobs"]):
+            return False
+    return len(legacy) == len(grouped)
+
+
+def grouped_installer_report(installers, item_checkins, jobs_map):
+    groups = server.installer_job_groups(item_checkins, jobs_map)
+    return server.installer_report_from_groups(installers, groups, jobs_map)
+
+
+def build_dataset(checkins_count, seed=42):
+    """~25 check-ins per installer, ~8 per job, up to 6 items per job with distinct areas."""
+    rng = random.Random(seed)
+    installers = [{"id": f"inst-{i}", "full_name": f"Instalador {i}", "branch": rng.choice(["POA", "SP"])}
+                  for i in range(max(1, checkins_count // 25))]
+    jobs_map = {}
+    for j in range(max(1, checkins_count // 8)):
+        jobs_map[f"job-{j}"] = {
+            "id": f"job-{j}",
+            "title": f"Job {j}",
+            "client_name": f"Cliente {j % 300}",
+            "area_m2": round(rng.uniform(5, 400), 2),
+            "status": rng.choice(["in_progress", "completed"]),
+            "products_with_area": [{"total_area_m2": round(rng.uniform(0.5, 80), 4)} for _ in range(rng.randint(1, 6))]
+        }
+    job_ids = list(jobs_map)
+    item_checkins = []
+    for _ in range(checkins_count):
+        job_id = rng.choice(job_ids)
+        duration = rng.randint(10, 480)
+        item_checkins.append({
+            "installer_id": rng.choice(installers)["id"],
+            "job_id": job_id,
+            "item_index": rng.randrange(len(jobs_map[job_id]["products_with_area"])),
+            "duration_minutes": duration,
+            "net_duration_minutes": rng.choice([None, duration - rng.randint(0, 10)])
+        })
+    return installers, item_checkins, jobs_map
+
+
+def timed(func, *args, repeat=3):
+    """Best of `repeat` runs with the garbage collector off (as timeit does)."""
+    best = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(*args)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def main():
+    max_checkins = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    sizes = []
+    size = 2500
+    while size <= max_checkins:
+        sizes.append(size)
+        size *= 2
+
+    print("=" * 92)
+    print("INSTALLER REPORT BENCHMARK — previous (installers × check-ins) vs single grouped pass")
+    print("=" * 92)
+    print(f"{'check-ins':>10} {'installers':>10} {'jobs':>7} | {'previous':>10} {'µs/check-in':>11} | "
+          f"{'grouped':>9} {'µs/check-in':>11} | speedup")
+
+    mismatches = 0
+    for size in sizes:
+        installers, item_checkins, jobs_map = build_dataset(size)
+        legacy_time, legacy = timed(legacy_installer_report, installers, item_checkins, jobs_map, repeat=1)
+        grouped_time, grouped = timed(grouped_installer_report, installers, item_checkins, jobs_map)
+        mismatches += not same_report(legacy, grouped)
+
+        print(f"{size:>10} {len(installers):>10} {len(jobs_map):>7} | "
+              f"{legacy_time * 1000:>8.1f}ms {legacy_time / size * 1e6:>11.2f} | "
+              f"{grouped_time * 1000:>7.1f}ms {grouped_time / size * 1e6:>11.2f} | {legacy_time / grouped_time:>6.1f}x")
+
+    print("-" * 92)
+    print(f"mismatches vs previous: {mismatches}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
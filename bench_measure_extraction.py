@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the product measure extractor (Largura/Altura/Cópias)
+on a corpus of Holdprint-shaped HTML descriptions. Runs offline.
+
+Usage: python bench_measure_extraction.py [corpus_size]
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("HOLDPRINT_SYNC_ENABLED", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+
+
+def legacy_extract_product_measures(description):
+    """Extractor as it was before the single-pass version (patterns re-parsed per call)."""
+    result = {"width_m": None, "height_m": None, "copies": 1, "area_m2": None}
+    if not description:
+        return result
+
+    for key, patterns, cast in (
+        ("width_m", [r'Largura:\s*<span[^>]*>([0-9.,]+)\s*m', r'Largura:\s*([0-9.,]+)\s*m', r'largura[:\s]+([0-9.,]+)\s*m'],
+         lambda v: float(v.replace(',', '.'))),
+        ("height_m", [r'Altura:\s*<span[^>]*>([0-9.,]+)\s*m', r'Altura:\s*([0-9.,]+)\s*m', r'altura[:\s]+([0-9.,]+)\s*m'],
+         lambda v: float(v.replace(',', '.'))),
+        ("copies", [r'Cópias:\s*<span[^>]*>([0-9]+)', r'Cópias:\s*([0-9]+)', r'copias[:\s]+([0-9]+)'], int),
+    ):
+        for pattern in patterns:
+            match = re.search(pattern, description, re.IGNORECASE)
+            if match:
+                result[key] = cast(match.group(1))
+                break
+
+    if result["width_m"] and result["height_m"]:
+        result["area_m2"] = round(result["width_m"] * result["height_m"] * result["copies"], 2)
+    return result
+
+
+def build_corpus(size, seed=42):
+    """Descriptions in the shapes seen in Holdprint jobs: span-wrapped, plain, lowercase and without measures."""
+    rng = random.Random(seed)
+    filler = (
+        "<p>Material: Lona frontlight 440g</p><p>Acabamento: ilhós a cada 50cm, bainha</p>"
+        "<p>Observações: conferir arte com o cliente antes da produção</p>"
+    )
+
+    def num():
+        return f"{rng.uniform(0.2, 12):.2f}".replace(".", rng.choice([".", ","]))
+
+    shapes = [
+        lambda: (f"<p>{filler}</p><p>Largura: <span style=\"color:#000\">{num()} m</span></p>"
+                 f"<p>Altura: <span style=\"color:#000\">{num()} m</span></p>"
+                 f"<p>Cópias: <span>{rng.randint(1, 20)}</span></p>"),
+        lambda: f"<p>{filler}</p><p>Largura: {num()} m</p><p>Altura: {num()} m</p><p>Cópias: {rng.randint(1, 20)}</p>",
+        lambda: f"{filler} largura {num()}m altura {num()}m copias {rng.randint(1, 20)}",
+        lambda: f"<p>{filler}</p><p>Tamanho conforme layout aprovado</p>",
+    ]
+    return [rng.choice(shapes)() for _ in range(size)]
+
+
+def run(label, func, corpus, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for description in corpus:
+            func(description)
+        best = min(best, time.perf_counter() - start)
+    per_call_us = best / len(corpus) * 1e6
+    print(f"{label:<40} {best * 1000:9.1f} ms  {per_call_us:7.2f} µs/call")
+    return best
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    corpus = build_corpus(size)
+
+    mismatches = sum(
+        1 for description in corpus
+        if legacy_extract_product_measures(description) != server._extract_product_measures(description)
+    )
+
+    print("=" * 72)
+    print(f"Measure extraction benchmark — {size} descriptions, {len(set(corpus))} distinct")
+    print("=" * 72)
+    legacy = run("legacy (re.search per pattern)", legacy_extract_product_measures, corpus)
+    single = run("single pass (precompiled)", server._extract_product_measures, corpus)
+    server.measures_cache.clear()
+    memo = run("single pass + memo (extract_product_measures)", server.extract_product_measures, corpus)
+    print("-" * 72)
+    print(f"speedup single pass: {legacy / single:.1f}x   with memo: {legacy / memo:.1f}x")
+    print(f"mismatches vs legacy: {mismatches}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,24 @@
 // Version-based cache name - change this to force update
 const CACHE_VERSION = 'v5';
 const CACHE_NAME = `industria-visual-${CACHE_VERSION}-${Date.now()}`;
+// Check-in photos are content-addressed (/api/photos/<sha256>) and never change, so they live in their
+// own cache, keyed without the ?token= query (the photo token rotates). It is dropped on version updates
+// and on logout (AuthContext deletes every 'industria-visual-photos' cache), and keeps at most
+// PHOTO_CACHE_MAX_ENTRIES photos, least recently used first out.
+const PHOTO_CACHE_NAME = `industria-visual-photos-${CACHE_VERSION}`;
+const PHOTO_CACHE_MAX_ENTRIES = 300;
+
+// Photo token = "<expiry in unix seconds>.<signature>": an expired token is never answered from the cache
+// (the signature itself is only checked by the server)
+const photoTokenValid = (token) => {
+  const expiresAt = Number((token || '').split('.')[0]);
+  return Number.isFinite(expiresAt) && expiresAt * 1000 > Date.now();
+};
+
+const trimPhotoCache = (cache) =>
+  cache.keys().then((keys) => Promise.all(
+    keys.slice(0, Math.max(keys.length - PHOTO_CACHE_MAX_ENTRIES, 0)).map((key) => cache.delete(key))
+  ));
 
 // Resources that should be cached (static assets only)
 const STATIC_CACHE = [
@@ -33,8 +51,8 @@ self.addEventListener('activate', (event) => {
     caches.keys().then((cacheNames) => {
       return Promise.all(
         cacheNames.map((cacheName) => {
-          // Delete ALL old caches except current
-          if (cacheName !== CACHE_NAME) {
+          // Delete ALL old caches except current (and the current photo cache)
+          if (cacheName !== CACHE_NAME && cacheName !== PHOTO_CACHE_NAME) {
             console.log('[SW] Deleting old cache:', cacheName);
             return caches.delete(cacheName);
           }
@@ -51,6 +69,30 @@ self.addEventListener('activate', (event) => {
 self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
   
+  // Check-in photos - cache first (immutable, one download per photo)
+  if (event.request.method === 'GET' && url.pathname.match(/\/api\/photos\/[0-9a-f]{64}(\/(thumbnail|medium))?$/) && photoTokenValid(url.searchParams.get('token')) && !event.request.headers.has('range')) {
+    const cacheKey = url.origin + url.pathname;
+    event.respondWith(
+      caches.open(PHOTO_CACHE_NAME).then((cache) =>
+        cache.match(cacheKey).then((cached) => {
+          if (cached) {
+            // Re-insert to move the photo to the end of the eviction order
+            const copy = cached.clone();
+            event.waitUntil(cache.delete(cacheKey).then(() => cache.put(cacheKey, copy)));
+            return cached;
+          }
+          return fetch(event.request).then((response) => {
+            if (response && response.status === 200) {
+              event.waitUntil(cache.put(cacheKey, response.clone()).then(() => trimPhotoCache(cache)));
+            }
+            return response;
+          });
+        })
+      )
+    );
+    return;
+  }
+  
   // Skip cross-origin requests
   if (!url.origin.includes(self.location.origin)) {
     return;
@@ -1,36 +1,72 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import axios from 'axios';
 import { jwtDecode } from 'jwt-decode';
+import { setPhotoToken } from '../utils/api';
 
 const AuthContext = createContext();
 
 const API_URL = (process.env.REACT_APP_API_URL || process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000') + '/api';
 
+// Token das URLs de fotos: renovado na metade da validade, para que uma URL já montada não chegue vencida ao <img>
+const fetchPhotoToken = async (sessionToken) => {
+  const response = await axios.get(`${API_URL}/auth/photo-token`, {
+    headers: { Authorization: `Bearer ${sessionToken}` }
+  });
+  setPhotoToken(response.data.token);
+  return Math.max((new Date(response.data.expires_at) - Date.now()) / 2, 60000);
+};
+
+// Fotos guardadas pelo service worker (caches 'industria-visual-photos-<versão>')
+const clearPhotoCaches = () => {
+  if (!('caches' in window)) return;
+  caches.keys().then((names) =>
+    Promise.all(names.filter((name) => name.startsWith('industria-visual-photos')).map((name) => caches.delete(name)))
+  );
+};
+
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
   const [token, setToken] = useState(localStorage.getItem('token'));
 
   useEffect(() => {
-    if (token) {
-      // Verify token and get user
-      axios
-        .get(`${API_URL}/auth/me`, {
-          headers: { Authorization: `Bearer ${token}` }
-        })
-        .then((response) => {
-          setUser(response.data);
+    if (!token) {
+      setLoading(false);
+      return undefined;
+    }
+
+    let refreshTimer;
+    const refreshPhotoToken = () => {
+      fetchPhotoToken(token)
+        .then((delay) => {
+          refreshTimer = setTimeout(refreshPhotoToken, delay);
         })
         .catch(() => {
-          // Token invalid, logout
-          logout();
-        })
-        .finally(() => {
-          setLoading(false);
+          refreshTimer = setTimeout(refreshPhotoToken, 60000);
         });
-    } else {
-      setLoading(false);
-    }
+    };
+
+    // Verify token and get user
+    Promise.all([
+      axios.get(`${API_URL}/auth/me`, {
+        headers: { Authorization: `Bearer ${token}` }
+      }),
+      // Sem o token das fotos a sessão continua válida: só as fotos falham até a próxima tentativa
+      fetchPhotoToken(token).catch(() => 60000)
+    ])
+      .then(([response, delay]) => {
+        setUser(response.data);
+        refreshTimer = setTimeout(refreshPhotoToken, delay);
+      })
+      .catch(() => {
+        // Token invalid, logout
+        logout();
+      })
+      .finally(() => {
+        setLoading(false);
+      });
+
+    return () => clearTimeout(refreshTimer);
   }, [token]);
 
   const login = async (email, password) => {
@@ -41,6 +77,8 @@ export const AuthProvider = ({ children }) => {
       });
 
       const { access_token, user: userData } = response.data;
+      // Antes de mostrar as telas, para que as fotos já saiam com o token (a renovação fica com o useEffect)
+      await fetchPhotoToken(access_token).catch(() => null);
       localStorage.setItem('token', access_token);
       setToken(access_token);
       setUser(userData);
@@ -55,6 +93,8 @@ export const AuthProvider = ({ children }) => {
 
   const logout = () => {
     localStorage.removeItem('token');
+    setPhotoToken(null);
+    clearPhotoCaches();
     setToken(null);
     setUser(null);
   };
@@ -87,4 +127,4 @@ export const useAuth = () => {
     throw new Error('useAuth must be used within AuthProvider');
   }
   return context;
-};
\ No newline at end of file
+};
@@ -43,7 +43,7 @@ const CheckOut = () => {
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
   const [photo, setPhoto] = useState(null);
-  const [photoBase64, setPhotoBase64] = useState(null);
+  const [photoFile, setPhotoFile] = useState(null);
   const [locationAuthorized, setLocationAuthorized] = useState(false);
   const [gpsCoords, setGpsCoords] = useState(null);
   const [gpsLoading, setGpsLoading] = useState(false);
@@ -125,29 +125,27 @@ const CheckOut = () => {
   const handleFileSelect = (e) => {
     const file = e.target.files[0];
     if (file && file.type.startsWith('image/')) {
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64 = reader.result;
-        setPhotoBase64(base64.split(',')[1]); // Remove prefix
-        setPhoto(base64);
-        toast.success('Foto selecionada!');
-      };
-      reader.readAsDataURL(file);
+      // Envia o arquivo original (multipart); a pré-visualização usa uma object URL, sem base64
+      if (photo) URL.revokeObjectURL(photo);
+      setPhotoFile(file);
+      setPhoto(URL.createObjectURL(file));
+      toast.success('Foto selecionada!');
     } else {
       toast.error('Por favor, selecione uma imagem válida');
     }
   };
 
   const retakePhoto = () => {
+    if (photo) URL.revokeObjectURL(photo);
     setPhoto(null);
-    setPhotoBase64(null);
+    setPhotoFile(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
     }
   };
 
   const handleSubmit = async () => {
-    if (!photoBase64) {
+    if (!photoFile) {
       toast.error('Tire uma foto ou faça upload de uma imagem');
       return;
     }
@@ -161,7 +159,7 @@ const CheckOut = () => {
 
     try {
       const formData = new FormData();
-      formData.append('photo_base64', photoBase64);
+      formData.append('photo', photoFile);
       formData.append('gps_lat', gpsCoords.latitude);
       formData.append('gps_long', gpsCoords.longitude);
       formData.append('gps_accuracy', gpsCoords.accuracy);
@@ -531,7 +529,7 @@ const CheckOut = () => {
       {/* Submit Button */}
       <Button
         onClick={handleSubmit}
-        disabled={!photoBase64 || !locationAuthorized || !gpsCoords || submitting}
+        disabled={!photoFile || !locationAuthorized || !gpsCoords || submitting}
         className="w-full bg-green-500 hover:bg-green-600 text-white h-14 text-lg"
         data-testid="submit-checkout-button"
       >
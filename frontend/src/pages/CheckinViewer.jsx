@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { MapPin, Clock, User, Image, FileText, ArrowLeft } from 'lucide-react';
@@ -136,7 +136,7 @@ const CheckinViewer = () => {
           </div>
 
           {/* Check-in Photo */}
-          {checkin.checkin_photo && (
+          {getCheckinPhotoSrc(checkin, 'checkin') && (
             <div className="space-y-2">
               <p className="text-sm text-muted-foreground flex items-center gap-2">
                 <Image className="h-4 w-4" />
@@ -144,7 +144,7 @@ const CheckinViewer = () => {
               </p>
               <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                 <img
-                  src={checkin.checkin_photo.startsWith('data:') ? checkin.checkin_photo : `data:image/jpeg;base64,${checkin.checkin_photo}`}
+                  src={getCheckinPhotoSrc(checkin, 'checkin')}
                   alt="Check-in"
                   className="w-full h-full object-contain"
                 />
@@ -226,7 +226,7 @@ const CheckinViewer = () => {
             </div>
 
             {/* Check-out Photo */}
-            {checkin.checkout_photo && (
+            {getCheckinPhotoSrc(checkin, 'checkout') && (
               <div className="space-y-2">
                 <p className="text-sm text-muted-foreground flex items-center gap-2">
                   <Image className="h-4 w-4" />
@@ -234,7 +234,7 @@ const CheckinViewer = () => {
                 </p>
                 <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                   <img
-                    src={checkin.checkout_photo.startsWith('data:') ? checkin.checkout_photo : `data:image/jpeg;base64,${checkin.checkout_photo}`}
+                    src={getCheckinPhotoSrc(checkin, 'checkout')}
                     alt="Check-out"
                     className="w-full h-full object-contain"
                   />
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
@@ -229,10 +229,10 @@ const Checkins = () => {
               </CardHeader>
               <CardContent className="space-y-3">
                 {/* Photo thumbnail */}
-                {checkin.checkin_photo && (
+                {getCheckinPhotoSrc(checkin, 'checkin') && (
                   <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                     <img
-                      src={checkin.checkin_photo.startsWith('data:') ? checkin.checkin_photo : `data:image/jpeg;base64,${checkin.checkin_photo}`}
+                      src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'thumbnail' })}
                       alt="Check-in"
                       className="w-full h-full object-cover"
                     />
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Briefcase, CheckCircle, Clock, Users, TrendingUp, MapPin, Image, Eye, Trash2 } from 'lucide-react';
 import { Button } from '../components/ui/button';
@@ -202,10 +202,10 @@ const Dashboard = () => {
                     </CardHeader>
                     <CardContent className="space-y-3">
                       {/* Photo thumbnail */}
-                      {checkin.checkin_photo && (
+                      {getCheckinPhotoSrc(checkin, 'checkin') && (
                         <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                           <img
-                            src={checkin.checkin_photo.startsWith('data:') ? checkin.checkin_photo : `data:image/jpeg;base64,${checkin.checkin_photo}`}
+                            src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'thumbnail' })}
                             alt="Check-in"
                             className="w-full h-full object-cover"
                           />
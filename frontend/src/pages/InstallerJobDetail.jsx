@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
@@ -124,31 +124,26 @@ const InstallerJobDetail = () => {
     input.onchange = async (e) => {
       const file = e.target.files[0];
       if (file) {
-        const reader = new FileReader();
-        reader.onload = async (event) => {
-          const base64 = event.target.result;
-          
-          if (type === 'checkin') {
-            await handleItemCheckin(itemIndex, base64);
-          } else {
-            await handleItemCheckout(itemIndex, base64);
-          }
-        };
-        reader.readAsDataURL(file);
+        // Arquivo original enviado em multipart (sem converter para base64)
+        if (type === 'checkin') {
+          await handleItemCheckin(itemIndex, file);
+        } else {
+          await handleItemCheckout(itemIndex, file);
+        }
       }
     };
     
     input.click();
   };
 
-  const handleItemCheckin = async (itemIndex, photoBase64) => {
+  const handleItemCheckin = async (itemIndex, photoFile) => {
     try {
       setProcessingItem(itemIndex);
       
       const formData = new FormData();
       formData.append('job_id', jobId);
       formData.append('item_index', itemIndex);
-      formData.append('photo_base64', photoBase64);
+      formData.append('photo', photoFile);
       formData.append('gps_lat', gpsLocation?.lat || -29.9);
       formData.append('gps_long', gpsLocation?.long || -51.1);
       formData.append('gps_accuracy', gpsLocation?.accuracy || 10);
@@ -164,7 +159,7 @@ const InstallerJobDetail = () => {
     }
   };
 
-  const handleItemCheckout = async (itemIndex, photoBase64) => {
+  const handleItemCheckout = async (itemIndex, photoFile) => {
     try {
       setProcessingItem(itemIndex);
       
@@ -184,7 +179,7 @@ const InstallerJobDetail = () => {
       const installedM2 = item?.total_area_m2 || 0; // Usar o m² calculado do item
       
       const formData = new FormData();
-      formData.append('photo_base64', photoBase64);
+      formData.append('photo', photoFile);
       formData.append('gps_lat', gpsLocation?.lat || -29.9);
       formData.append('gps_long', gpsLocation?.long || -51.1);
       formData.append('gps_accuracy', gpsLocation?.accuracy || 10);
@@ -479,21 +474,21 @@ const InstallerJobDetail = () => {
                       {/* Check-in/Check-out Photos */}
                       {checkin && (
                         <div className="grid grid-cols-2 gap-3">
-                          {checkin.checkin_photo && (
+                          {getCheckinPhotoSrc(checkin, 'checkin') && (
                             <div>
                               <p className="text-xs text-muted-foreground mb-1">Foto Check-in</p>
                               <img 
-                                src={checkin.checkin_photo.startsWith('data:') ? checkin.checkin_photo : `data:image/jpeg;base64,${checkin.checkin_photo}`}
+                                src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'thumbnail' })}
                                 alt="Check-in"
                                 className="w-full h-24 object-cover rounded-lg"
                               />
                             </div>
                           )}
-                          {checkin.checkout_photo && (
+                          {getCheckinPhotoSrc(checkin, 'checkout') && (
                             <div>
                               <p className="text-xs text-muted-foreground mb-1">Foto Check-out</p>
                               <img 
-                                src={checkin.checkout_photo.startsWith('data:') ? checkin.checkout_photo : `data:image/jpeg;base64,${checkin.checkout_photo}`}
+                                src={getCheckinPhotoSrc(checkin, 'checkout', { size: 'thumbnail' })}
                                 alt="Check-out"
                                 className="w-full h-24 object-cover rounded-lg"
                               />
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, DialogTrigger, DialogFooter } from '../components/ui/dialog';
@@ -1232,13 +1232,13 @@ const JobDetail = () => {
                         {/* Foto Check-in */}
                         <div className="space-y-2">
                           <p className="text-xs text-muted-foreground font-medium">📷 Foto Check-in</p>
-                          {checkin.checkin_photo ? (
+                          {getCheckinPhotoSrc(checkin, 'checkin') ? (
                             <div className="relative group">
                               <img 
-                                src={`data:image/jpeg;base64,${checkin.checkin_photo}`}
+                                src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'thumbnail' })}
                                 alt="Check-in"
                                 className="w-full h-32 object-cover rounded-lg border border-white/10 cursor-pointer hover:opacity-80 transition-opacity"
-                                onClick={() => window.open(`data:image/jpeg;base64,${checkin.checkin_photo}`, '_blank')}
+                                onClick={() => window.open(getCheckinPhotoSrc(checkin, 'checkin'), '_blank')}
                               />
                               <div className="absolute bottom-1 left-1 px-2 py-0.5 bg-black/70 rounded text-xs text-white">
                                 Check-in
@@ -1254,13 +1254,13 @@ const JobDetail = () => {
                         {/* Foto Checkout */}
                         <div className="space-y-2">
                           <p className="text-xs text-muted-foreground font-medium">📷 Foto Checkout</p>
-                          {checkin.checkout_photo ? (
+                          {getCheckinPhotoSrc(checkin, 'checkout') ? (
                             <div className="relative group">
                               <img 
-                                src={`data:image/jpeg;base64,${checkin.checkout_photo}`}
+                                src={getCheckinPhotoSrc(checkin, 'checkout', { size: 'thumbnail' })}
                                 alt="Checkout"
                                 className="w-full h-32 object-cover rounded-lg border border-white/10 cursor-pointer hover:opacity-80 transition-opacity"
-                                onClick={() => window.open(`data:image/jpeg;base64,${checkin.checkout_photo}`, '_blank')}
+                                onClick={() => window.open(getCheckinPhotoSrc(checkin, 'checkout'), '_blank')}
                               />
                               <div className="absolute bottom-1 left-1 px-2 py-0.5 bg-black/70 rounded text-xs text-white">
                                 Checkout
@@ -1499,7 +1499,7 @@ const JobDetail = () => {
                         </h4>
                         
                         {/* Check-in Photo */}
-                        {checkin.checkin_photo && (
+                        {getCheckinPhotoSrc(checkin, 'checkin') && (
                           <div className="space-y-2">
                             <p className="text-xs text-muted-foreground flex items-center gap-1">
                               <Image className="h-3 w-3" />
@@ -1507,7 +1507,7 @@ const JobDetail = () => {
                             </p>
                             <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                               <img
-                                src={checkin.checkin_photo.startsWith('data:') ? checkin.checkin_photo : `data:image/jpeg;base64,${checkin.checkin_photo}`}
+                                src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'medium' })}
                                 alt="Check-in"
                                 className="w-full h-full object-cover"
                               />
@@ -1566,7 +1566,7 @@ const JobDetail = () => {
                           </div>
 
                           {/* Check-out Photo */}
-                          {checkin.checkout_photo && (
+                          {getCheckinPhotoSrc(checkin, 'checkout') && (
                             <div className="space-y-2">
                               <p className="text-xs text-muted-foreground flex items-center gap-1">
                                 <Image className="h-3 w-3" />
@@ -1574,7 +1574,7 @@ const JobDetail = () => {
                               </p>
                               <div className="relative aspect-video bg-black rounded-lg overflow-hidden">
                                 <img
-                                  src={checkin.checkout_photo.startsWith('data:') ? checkin.checkout_photo : `data:image/jpeg;base64,${checkin.checkout_photo}`}
+                                  src={getCheckinPhotoSrc(checkin, 'checkout', { size: 'medium' })}
                                   alt="Check-out"
                                   className="w-full h-full object-cover"
                                 />
@@ -58,10 +58,12 @@ const Jobs = () => {
 
   const loadHoldprintJobs = async () => {
     setLoadingHoldprint(true);
+    setHoldprintJobs([]);
     try {
-      const response = await api.getHoldprintJobs(selectedBranch);
-      setHoldprintJobs(response.data.jobs || []);
-      toast.success(`${response.data.jobs?.length || 0} jobs encontrados em ${selectedBranch}`);
+      const total = await api.streamHoldprintJobs(selectedBranch, (jobs) => {
+        setHoldprintJobs((prev) => [...prev, ...jobs]);
+      });
+      toast.success(`${total} jobs encontrados em ${selectedBranch}`);
     } catch (error) {
       toast.error('Erro ao buscar jobs da Holdprint');
     } finally {
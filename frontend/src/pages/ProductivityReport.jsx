@@ -43,6 +43,8 @@ const ProductivityReport = () => {
   const [expandedInstallers, setExpandedInstallers] = useState({});
   const [expandedJobs, setExpandedJobs] = useState({});
   const [expandedFamilies, setExpandedFamilies] = useState({});
+  // Records of each expanded group, loaded on demand ("type:id" -> records)
+  const [groupRecords, setGroupRecords] = useState({});
 
   useEffect(() => {
     if (user?.role !== 'admin' && user?.role !== 'manager') {
@@ -61,6 +63,7 @@ const ProductivityReport = () => {
         api.getJobs()
       ]);
       setReport(reportRes.data);
+      setGroupRecords({});
       setInstallers(installersRes.data);
       setJobs(jobsRes.data);
     } catch (error) {
@@ -82,7 +85,21 @@ const ProductivityReport = () => {
     setTimeout(() => fetchData(), 100);
   };
 
+  const loadGroupRecords = async (type, id) => {
+    const key = `${type}:${id}`;
+    if (groupRecords[key]) return;
+    // Same filters as the report on screen
+    const filters = report?.summary?.filters_applied || {};
+    try {
+      const res = await api.getProductivityRecords({ group_by: type, group_id: id, limit: 10, ...filters });
+      setGroupRecords(prev => ({ ...prev, [key]: res.data.records }));
+    } catch (error) {
+      console.error('Error fetching records:', error);
+    }
+  };
+
   const toggleExpanded = (type, id) => {
+    loadGroupRecords(type, id);
     if (type === 'installer') {
       setExpandedInstallers(prev => ({ ...prev, [id]: !prev[id] }));
     } else if (type === 'job') {
@@ -354,10 +371,10 @@ const ProductivityReport = () => {
                           )}
                         </div>
                       </button>
-                      {expandedInstallers[inst.installer_id] && inst.records?.length > 0 && (
+                      {expandedInstallers[inst.installer_id] && groupRecords[`installer:${inst.installer_id}`]?.length > 0 && (
                         <div className="border-t border-white/10 p-3 space-y-2 bg-black/20">
                           <p className="text-xs text-muted-foreground uppercase tracking-wide">Últimas execuções (Tempo Líquido)</p>
-                          {inst.records.slice(0, 10).map((rec, i) => (
+                          {groupRecords[`installer:${inst.installer_id}`].map((rec, i) => (
                             <div key={i} className="flex items-center justify-between text-sm py-1 border-b border-white/5 last:border-0">
                               <div>
                                 <p className="text-white text-xs md:text-sm line-clamp-1">{rec.item_name}</p>
@@ -421,10 +438,10 @@ const ProductivityReport = () => {
                           )}
                         </div>
                       </button>
-                      {expandedJobs[job.job_id] && job.records?.length > 0 && (
+                      {expandedJobs[job.job_id] && groupRecords[`job:${job.job_id}`]?.length > 0 && (
                         <div className="border-t border-white/10 p-3 space-y-2 bg-black/20">
                           <p className="text-xs text-muted-foreground uppercase tracking-wide">Itens executados</p>
-                          {job.records.slice(0, 10).map((rec, i) => (
+                          {groupRecords[`job:${job.job_id}`].map((rec, i) => (
                             <div key={i} className="flex items-center justify-between text-sm py-1 border-b border-white/5 last:border-0">
                               <div>
                                 <p className="text-white text-xs md:text-sm line-clamp-1">{rec.item_name}</p>
@@ -485,10 +502,10 @@ const ProductivityReport = () => {
                           )}
                         </div>
                       </button>
-                      {expandedFamilies[family.family_name] && family.records?.length > 0 && (
+                      {expandedFamilies[family.family_name] && groupRecords[`family:${family.family_name}`]?.length > 0 && (
                         <div className="border-t border-white/10 p-3 space-y-2 bg-black/20">
                           <p className="text-xs text-muted-foreground uppercase tracking-wide">Últimas execuções</p>
-                          {family.records.slice(0, 10).map((rec, i) => (
+                          {groupRecords[`family:${family.family_name}`].map((rec, i) => (
                             <div key={i} className="flex items-center justify-between text-sm py-1 border-b border-white/5 last:border-0">
                               <div>
                                 <p className="text-white text-xs md:text-sm line-clamp-1">{rec.item_name}</p>
@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useMemo, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import api from '../utils/api';
+import api, { getCheckinPhotoSrc } from '../utils/api';
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
@@ -273,12 +273,6 @@ const Reports = () => {
     return `${mins}min`;
   };
 
-  const getPhotoSrc = (photoData) => {
-    if (!photoData) return null;
-    if (photoData.startsWith('data:image')) return photoData;
-    return `data:image/jpeg;base64,${photoData}`;
-  };
-
   const openPhotoModal = (photo, type) => {
     setSelectedPhoto(photo);
     setPhotoType(type);
@@ -871,15 +865,15 @@ const Reports = () => {
 
                         {/* Photos Section */}
                         <div className="flex gap-3 flex-wrap md:flex-nowrap">
-                          {checkin.checkin_photo && (
+                          {getCheckinPhotoSrc(checkin, 'checkin') && (
                             <div className="space-y-1">
                               <p className="text-xs text-muted-foreground text-center">Check-in</p>
                               <button
-                                onClick={() => openPhotoModal(checkin.checkin_photo, 'Check-in')}
+                                onClick={() => openPhotoModal(getCheckinPhotoSrc(checkin, 'checkin'), 'Check-in')}
                                 className="relative group"
                               >
                                 <img 
-                                  src={getPhotoSrc(checkin.checkin_photo)} 
+                                  src={getCheckinPhotoSrc(checkin, 'checkin', { size: 'thumbnail' })} 
                                   alt="Check-in" 
                                   className="w-24 h-24 md:w-32 md:h-32 object-cover rounded-lg border border-white/20 hover:border-primary transition-colors"
                                 />
@@ -889,15 +883,15 @@ const Reports = () => {
                               </button>
                             </div>
                           )}
-                          {checkin.checkout_photo && (
+                          {getCheckinPhotoSrc(checkin, 'checkout') && (
                             <div className="space-y-1">
                               <p className="text-xs text-muted-foreground text-center">Check-out</p>
                               <button
-                                onClick={() => openPhotoModal(checkin.checkout_photo, 'Check-out')}
+                                onClick={() => openPhotoModal(getCheckinPhotoSrc(checkin, 'checkout'), 'Check-out')}
                                 className="relative group"
                               >
                                 <img 
-                                  src={getPhotoSrc(checkin.checkout_photo)} 
+                                  src={getCheckinPhotoSrc(checkin, 'checkout', { size: 'thumbnail' })} 
                                   alt="Check-out" 
                                   className="w-24 h-24 md:w-32 md:h-32 object-cover rounded-lg border border-white/20 hover:border-primary transition-colors"
                                 />
@@ -907,7 +901,7 @@ const Reports = () => {
                               </button>
                             </div>
                           )}
-                          {!checkin.checkin_photo && !checkin.checkout_photo && (
+                          {!getCheckinPhotoSrc(checkin, 'checkin') && !getCheckinPhotoSrc(checkin, 'checkout') && (
                             <div className="w-32 h-32 bg-white/5 rounded-lg border border-white/10 flex items-center justify-center">
                               <p className="text-xs text-muted-foreground text-center">Sem fotos</p>
                             </div>
@@ -953,7 +947,7 @@ const Reports = () => {
           {selectedPhoto && (
             <div className="flex justify-center">
               <img 
-                src={getPhotoSrc(selectedPhoto)} 
+                src={selectedPhoto} 
                 alt={photoType} 
                 className="max-w-full max-h-[70vh] object-contain rounded-lg"
               />
@@ -7,6 +7,27 @@ const getAuthHeader = () => {
   return token ? { Authorization: `Bearer ${token}` } : {};
 };
 
+// Token de curta duração que só abre /photos (GET /auth/photo-token), renovado pelo AuthContext.
+// Fica só em memória; o JWT da sessão nunca vai numa URL.
+let photoToken = null;
+export const setPhotoToken = (token) => {
+  photoToken = token;
+};
+
+// Foto de check-in/check-out: URL do endpoint /photos (cache imutável no navegador) quando o
+// registro tem a referência; senão o base64 inline dos registros antigos.
+// O <img> não envia o header Authorization, então o token de fotos vai em ?token=.
+// size: 'thumbnail' (256 px, galerias), 'medium' (640 px, cards) ou null (foto inteira)
+export const getCheckinPhotoSrc = (checkin, kind = 'checkin', { size = null } = {}) => {
+  const photoId = checkin?.[`${kind}_photo_id`];
+  if (photoId) {
+    return `${API_URL}/photos/${photoId}${size ? `/${size}` : ''}${photoToken ? `?token=${encodeURIComponent(photoToken)}` : ''}`;
+  }
+  const photo = checkin?.[`${kind}_photo`];
+  if (!photo) return null;
+  return photo.startsWith('data:') ? photo : `data:image/jpeg;base64,${photo}`;
+};
+
 export const api = {
   // Auth
   login: (email, password) => axios.post(`${API_URL}/auth/login`, { email, password }),
@@ -28,7 +49,39 @@ export const api = {
   updateInstaller: (installerId, data) => axios.put(`${API_URL}/installers/${installerId}`, data, { headers: getAuthHeader() }),
 
   // Holdprint & Jobs
-  getHoldprintJobs: (branch) => axios.get(`${API_URL}/holdprint/jobs/${branch}`, { headers: getAuthHeader() }),
+  // Jobs da Holdprint chegam em NDJSON (um job por linha) conforme as páginas são baixadas.
+  // onJobs é chamado a cada lote recebido; retorna o total de jobs.
+  streamHoldprintJobs: async (branch, onJobs) => {
+    const response = await fetch(`${API_URL}/holdprint/jobs/${branch}`, { headers: getAuthHeader() });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let total = 0;
+    const emit = (lines) => {
+      const jobs = [];
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const parsed = JSON.parse(line);
+        if (parsed.error) throw new Error(parsed.error);
+        jobs.push(parsed);
+      }
+      if (jobs.length > 0) {
+        total += jobs.length;
+        onJobs(jobs);
+      }
+    };
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      emit(lines);
+    }
+    emit([buffer + decoder.decode()]);
+    return total;
+  },
   createJob: (data) => axios.post(`${API_URL}/jobs`, data, { headers: getAuthHeader() }),
   getJobs: () => axios.get(`${API_URL}/jobs`, { headers: getAuthHeader() }),
   getJob: (jobId) => axios.get(`${API_URL}/jobs/${jobId}`, { headers: getAuthHeader() }),
@@ -130,6 +183,13 @@ export const api = {
     const queryString = queryParams.toString();
     return axios.get(`${API_URL}/reports/productivity${queryString ? '?' + queryString : ''}`, { headers: getAuthHeader() });
   },
+  getProductivityRecords: (params = {}) => {
+    const queryParams = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== null && value !== undefined && value !== '') queryParams.append(key, value);
+    });
+    return axios.get(`${API_URL}/reports/productivity/records?${queryParams.toString()}`, { headers: getAuthHeader() });
+  },
   classifyJobProducts: (jobId) => axios.post(`${API_URL}/jobs/${jobId}/classify-products`, {}, { headers: getAuthHeader() }),
   recalculateJobAreas: () => axios.post(`${API_URL}/jobs/recalculate-areas`, {}, { headers: getAuthHeader() }),
   exportReports: () => axios.get(`${API_URL}/reports/export`, { 
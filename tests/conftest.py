@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Os módulos do backend são importados pelo nome (como o uvicorn faz em backend/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# Importar o server.py só cria o cliente do Motor (a conexão é preguiçosa); os workers de startup ficam desligados
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "instalmonitor_test")
+os.environ.setdefault("HOLDPRINT_SYNC_ENABLED", "false")
+os.environ.setdefault("JOBS_MIGRATION_ENABLED", "false")
+os.environ.setdefault("PHOTOS_MIGRATION_ENABLED", "false")
@@ -0,0 +1,204 @@
+import random
+
+import numpy as np
+import pytest
+
+from analytics import ColumnarTable, DictionaryEncoder, GroupBy, date_mask
+
+
+def make_table():
+    return ColumnarTable({"m2": np.float64, "minutes": np.float64}, encoded=("installer_id", "family_name"))
+
+
+def alive_rows(table):
+    """{row_id: (installer_id, family_name, m2)} das linhas vivas"""
+    positions = np.flatnonzero(table.alive)
+    installers = table.decode("installer_id", table.column("installer_id")[positions])
+    families = table.decode("family_name", table.column("family_name")[positions])
+    m2 = table.column("m2")[positions].tolist()
+    return {row_id: row for row_id, row in zip(table.ids(positions), zip(installers, families, m2))}
+
+
+def test_dictionary_encoder_codes_in_order_of_appearance():
+    encoder = DictionaryEncoder()
+    assert [encoder.encode(value) for value in ["b", None, "a", "b", None]] == [0, 1, 2, 0, 1]
+    assert encoder.code("a") == 2
+    assert encoder.code("never seen") == -1
+    assert encoder.decode([2, 1, 0]) == ["a", None, "b"]
+    assert len(encoder) == 3
+
+
+def test_extend_skips_duplicate_ids_and_stores_missing_measures_as_nan():
+    table = make_table()
+    added = table.extend([
+        ("ic1", {"installer_id": "i1", "family_name": "Lona", "m2": 2.5, "minutes": 30}),
+        ("ic1", {"installer_id": "i2", "family_name": "ACM", "m2": 9.0, "minutes": 10}),
+        ("ic2", {"installer_id": "i2", "family_name": None, "m2": None}),
+    ])
+    assert added == 2
+    assert table.extend([("ic2", {"installer_id": "i3", "m2": 1.0})]) == 0
+    assert len(table) == 2
+    rows = alive_rows(table)
+    assert rows["ic1"] == ("i1", "Lona", 2.5)
+    assert rows["ic2"][:2] == ("i2", None)
+    assert np.isnan(rows["ic2"][2])
+    assert np.isnan(table.column("minutes")[1])
+
+
+def test_extend_grows_past_the_initial_capacity():
+    table = make_table()
+    for start in range(0, 3000, 700):
+        table.extend((f"ic{n}", {"installer_id": f"i{n % 7}", "m2": float(n)}) for n in range(start, min(start + 700, 3000)))
+    assert table.size == len(table) == 3000
+    assert table.column("m2").tolist() == [float(n) for n in range(3000)]
+    assert table.decode("installer_id", table.column("installer_id")[[0, 8, 2999]]) == ["i0", "i1", "i3"]
+
+
+def test_removed_row_can_be_added_again_with_new_values():
+    table = make_table()
+    table.extend([
+        ("ic1", {"installer_id": "i1", "family_name": "Lona", "m2": 1.0}),
+        ("ic2", {"installer_id": "i1", "family_name": "ACM", "m2": 2.0}),
+    ])
+    assert table.remove("ic1")
+    assert not table.remove("ic1")
+    assert not table.remove("unknown")
+
+    # O check-out refeito entra como linha nova; a antiga continua gravada, mas morta
+    assert table.extend([("ic1", {"installer_id": "i2", "family_name": "Lona", "m2": 5.0})]) == 1
+    assert table.size == 3
+    assert len(table) == 2
+    assert table.alive.tolist() == [False, True, True]
+    assert alive_rows(table) == {"ic1": ("i2", "Lona", 5.0), "ic2": ("i1", "ACM", 2.0)}
+
+    # Remover de novo atinge a linha nova, e um terceiro extend volta a aceitar o id
+    assert table.remove("ic1")
+    assert alive_rows(table) == {"ic2": ("i1", "ACM", 2.0)}
+    assert table.extend([("ic1", {"installer_id": "i3", "family_name": None, "m2": 7.0})]) == 1
+    assert alive_rows(table) == {"ic1": ("i3", None, 7.0), "ic2": ("i1", "ACM", 2.0)}
+
+
+def test_remove_where_only_touches_live_rows_of_the_value():
+    table = make_table()
+    table.extend((f"ic{n}", {"installer_id": f"i{n % 3}", "family_name": "Lona", "m2": float(n)}) for n in range(9))
+    table.remove("ic0")
+
+    assert table.remove_where("installer_id", "i0") == 2  # ic3 e ic6; ic0 já tinha saído
+    assert sorted(alive_rows(table)) == ["ic1", "ic2", "ic4", "ic5", "ic7", "ic8"]
+    assert table.remove_where("installer_id", "i0") == 0
+    assert len(table) == 6
+
+    # As linhas removidas podem voltar com o mesmo id
+    assert table.extend([("ic3", {"installer_id": "i0", "m2": 30.0})]) == 1
+    assert alive_rows(table)["ic3"] == ("i0", None, 30.0)
+
+
+def test_remove_where_with_unseen_value_removes_nothing():
+    table = make_table()
+    table.extend([("ic1", {"installer_id": "i1", "family_name": None, "m2": 1.0})])
+    assert table.remove_where("installer_id", "never seen") == 0
+    assert table.remove_where("family_name", "Adesivo") == 0
+    assert table.alive.tolist() == [True]
+    assert len(table) == 1
+    # Consultar não cadastra o valor no dicionário
+    assert table.code("installer_id", "never seen") == -1
+
+    empty = make_table()
+    assert empty.remove_where("installer_id", "i1") == 0
+
+
+def test_date_mask_bounds_are_inclusive_and_missing_timestamps_pass():
+    timestamps = np.array([10.0, 20.0, np.nan, 30.0, 40.0])
+    assert date_mask(timestamps).tolist() == [True] * 5
+    assert date_mask(timestamps, 20.0, 30.0).tolist() == [False, True, True, True, False]
+    assert date_mask(timestamps, start=35.0).tolist() == [False, False, True, False, True]
+    assert date_mask(timestamps, end=10.0).tolist() == [True, False, True, False, False]
+    assert date_mask(np.empty(0)).tolist() == []
+
+
+def python_groups(rows, *keys):
+    """Referência: {chave: [posições na ordem da tabela]}"""
+    groups = {}
+    for row in rows.tolist():
+        groups.setdefault(tuple(int(key[row]) for key in keys), []).append(row)
+    return dict(sorted(groups.items()))
+
+
+def test_group_by_single_key():
+    installer = np.array([2, 0, 2, 1, 0, 2], dtype=np.int32)
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    rows = np.array([0, 1, 2, 4, 5])
+    groups = GroupBy(rows, installer)
+
+    assert groups.size == 2
+    assert groups.first_rows.tolist() == [1, 0]
+    assert groups.counts.tolist() == [2, 3]
+    assert groups.sum(values).tolist() == [7.0, 10.0]
+    assert groups.head(2) == [[1, 4], [0, 2]]
+
+
+def test_group_by_multiple_keys_matches_python_grouping():
+    rng = np.random.default_rng(7)
+    size = 500
+    # Códigos esparsos e de larguras diferentes, para o ravel_multi_index não colidir por acaso
+    installer = rng.integers(0, 40, size).astype(np.int32)
+    family = rng.choice([0, 3, 11], size).astype(np.int32)
+    day = rng.integers(0, 200, size).astype(np.int32)
+    job = rng.integers(0, 25, size).astype(np.int32)
+    values = rng.uniform(0, 10, size)
+    rows = np.flatnonzero(rng.random(size) < 0.7)
+
+    groups = GroupBy(rows, installer, family, day)
+    expected = python_groups(rows, installer, family, day)
+
+    assert groups.size == len(expected)
+    assert groups.counts.tolist() == [len(members) for members in expected.values()]
+    assert groups.first_rows.tolist() == [members[0] for members in expected.values()]
+    assert groups.sum(values) == pytest.approx([values[members].sum() for members in expected.values()])
+    assert groups.distinct(job) == [sorted(set(job[members].tolist())) for members in expected.values()]
+    assert groups.head(3) == [members[:3] for members in expected.values()]
+
+
+def test_group_by_keys_with_a_single_code():
+    rows = np.arange(4)
+    groups = GroupBy(rows, np.zeros(4, dtype=np.int32), np.array([0, 1, 0, 1], dtype=np.int32))
+    assert groups.counts.tolist() == [2, 2]
+    assert groups.first_rows.tolist() == [0, 1]
+
+
+def test_group_by_without_rows():
+    key = np.array([0, 1], dtype=np.int32)
+    for groups in (GroupBy(np.empty(0, dtype=np.int64), key), GroupBy(np.empty(0, dtype=np.int64), key, key)):
+        assert groups.size == 0
+        assert groups.sum(np.array([1.0, 2.0])).tolist() == []
+        assert groups.distinct(key) == []
+        assert groups.head(5) == []
+        assert groups.percentiles(np.array([1.0, 2.0]), [50, 90]).shape == (0, 2)
+
+
+def test_percentiles_match_numpy_linear_interpolation():
+    rng = random.Random(3)
+    size = 400
+    family = np.array([rng.randrange(6) for _ in range(size)], dtype=np.int32)
+    values = np.array([rng.choice([rng.uniform(0, 100), 5.0]) for _ in range(size)])  # com repetidos
+    rows = np.array([row for row in range(size) if rng.random() < 0.8])
+    percentiles = [0, 10, 25, 50, 66.6, 75, 90, 99, 100]
+
+    groups = GroupBy(rows, family)
+    result = groups.percentiles(values, percentiles)
+
+    expected = python_groups(rows, family)
+    assert result.shape == (len(expected), len(percentiles))
+    for group, members in enumerate(expected.values()):
+        assert result[group] == pytest.approx(np.percentile(values[members], percentiles))
+
+
+def test_percentiles_of_small_groups():
+    key = np.array([0, 1, 1, 2, 2, 2, 2], dtype=np.int32)
+    values = np.array([7.0, 4.0, 1.0, 10.0, 40.0, 20.0, 30.0])
+    result = GroupBy(np.arange(7), key).percentiles(values, [0, 25, 50, 100])
+    assert result.tolist() == [
+        [7.0, 7.0, 7.0, 7.0],         # um valor só
+        [1.0, 1.75, 2.5, 4.0],        # entre os dois valores
+        [10.0, 17.5, 25.0, 40.0],     # ordenado dentro do grupo
+    ]
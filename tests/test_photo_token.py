@@ -0,0 +1,27 @@
+import time
+
+import server
+from server import create_access_token, create_photo_token, photo_token_signature, verify_photo_token
+
+
+def test_photo_token_round_trip():
+    token, expires_at = create_photo_token()
+    assert verify_photo_token(token)
+    assert expires_at - time.time() <= server.PHOTO_TOKEN_EXPIRE_MINUTES * 60
+
+
+def test_expired_photo_token_is_rejected():
+    expires_at = int(time.time()) - 1
+    assert not verify_photo_token(f"{expires_at}.{photo_token_signature(expires_at)}")
+
+
+def test_photo_token_signature_is_bound_to_the_expiry():
+    token, expires_at = create_photo_token()
+    signature = token.split(".")[1]
+    assert not verify_photo_token(f"{expires_at + 3600}.{signature}")
+
+
+def test_malformed_tokens_and_session_jwt_are_rejected():
+    session = create_access_token({"sub": "u1"})
+    for token in ("", "abc", ".", "123", "-5.abc", "1e20.abc", session):
+        assert not verify_photo_token(token)
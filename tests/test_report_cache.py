@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+
+from server import ReportCache
+
+
+class Report:
+    """compute() de teste: conta as chamadas e, com `gate`, só termina quando o teste liberar"""
+
+    def __init__(self, gate: bool = False):
+        self.calls = 0
+        self.gate = asyncio.Event() if gate else None
+
+    async def __call__(self):
+        self.calls += 1
+        value = self.calls
+        if self.gate is not None:
+            await self.gate.wait()
+        return value
+
+    async def started(self, calls: int):
+        """Espera o cálculo número `calls` começar (ele roda numa tarefa própria do cache)"""
+        while self.calls < calls:
+            await asyncio.sleep(0)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_hit_after_miss():
+    async def scenario():
+        cache, report = ReportCache(), Report()
+        assert await cache.get(("metrics", "admin"), report) == 1
+        assert await cache.get(("metrics", "admin"), report) == 1
+        assert await cache.get(("metrics", "manager"), report) == 2
+        return cache, report
+
+    cache, report = run(scenario())
+    assert report.calls == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale_hits"], stats["misses"], stats["entries"]) == (1, 0, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3, abs=0.001)
+
+
+def test_concurrent_misses_share_one_computation():
+    async def scenario():
+        cache, report = ReportCache(), Report(gate=True)
+        waiting = [asyncio.create_task(cache.get(("metrics", "admin"), report)) for _ in range(5)]
+        await report.started(1)
+        assert cache.stats()["refreshing"] == 1
+        report.gate.set()
+        return cache, report, await asyncio.gather(*waiting)
+
+    cache, report, values = run(scenario())
+    assert values == [1] * 5
+    assert report.calls == 1
+    assert cache.stats()["misses"] == 5
+    assert cache.stats()["refreshing"] == 0
+
+
+def test_stale_entry_is_served_while_one_request_recomputes():
+    async def scenario():
+        cache, report = ReportCache(), Report(gate=True)
+        report.gate.set()
+        await cache.get(("metrics", "admin"), report)
+
+        cache.bump_version()
+        report.gate.clear()
+        refresh = asyncio.create_task(cache.get(("metrics", "admin"), report))
+        await report.started(2)
+        # Enquanto o recálculo não termina, os outros pedidos levam o valor anterior sem esperar
+        stale = [await cache.get(("metrics", "admin"), report) for _ in range(3)]
+        report.gate.set()
+        refreshed = await refresh
+        return cache, report, stale, refreshed, await cache.get(("metrics", "admin"), report)
+
+    cache, report, stale, refreshed, after = run(scenario())
+    assert stale == [1, 1, 1]
+    assert (refreshed, after) == (2, 2)
+    assert report.calls == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale_hits"], stats["misses"]) == (1, 3, 2)
+
+
+def test_write_during_computation_leaves_the_result_stale():
+    async def scenario():
+        cache, report = ReportCache(), Report(gate=True)
+        first = asyncio.create_task(cache.get(("metrics", "admin"), report))
+        await report.started(1)
+        # Uma escrita chega depois de o cálculo começar: o resultado pode não incluí-la
+        cache.bump_version()
+        report.gate.set()
+        value = await first
+        return cache, report, value, await cache.get(("metrics", "admin"), report)
+
+    cache, report, value, after = run(scenario())
+    assert (value, after) == (1, 2)
+    assert report.calls == 2
+    assert cache.stats()["hits"] == 0
+
+
+def test_write_during_refresh_keeps_serving_the_refresh_then_recomputes():
+    async def scenario():
+        cache, report = ReportCache(), Report(gate=True)
+        report.gate.set()
+        await cache.get(("metrics", "admin"), report)
+
+        cache.bump_version()
+        report.gate.clear()
+        refresh = asyncio.create_task(cache.get(("metrics", "admin"), report))
+        await report.started(2)
+        cache.bump_version()
+        # Ainda há um recálculo em andamento: o valor antigo continua sendo servido, sem disparar outro
+        assert await cache.get(("metrics", "admin"), report) == 1
+        assert report.calls == 2
+        report.gate.set()
+        assert await refresh == 2
+        return cache, report, await cache.get(("metrics", "admin"), report)
+
+    cache, report, after = run(scenario())
+    assert after == 3
+    assert report.calls == 3
+
+
+def test_entries_expire_after_the_ttl():
+    async def scenario():
+        cache, report = ReportCache(ttl_seconds=0), Report()
+        values = [await cache.get(("metrics", "admin"), report) for _ in range(2)]
+        return cache, values
+
+    cache, values = run(scenario())
+    assert values == [1, 2]
+    assert cache.stats()["hits"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def scenario():
+        cache, report = ReportCache(max_entries=2), Report()
+        await cache.get(("a",), report)
+        await cache.get(("b",), report)
+        await cache.get(("a",), report)  # "a" passa a ser a mais recente
+        await cache.get(("c",), report)
+        return cache, report, await cache.get(("a",), report), await cache.get(("b",), report)
+
+    cache, report, a, b = run(scenario())
+    assert a == 1
+    assert b == 4  # "b" tinha saído e foi recalculado
+    assert cache.stats()["entries"] == 2
+
+
+def test_failed_computation_is_not_cached():
+    async def scenario():
+        cache, calls = ReportCache(), []
+
+        async def failing():
+            calls.append(1)
+            raise RuntimeError("mongo fora")
+
+        with pytest.raises(RuntimeError):
+            await cache.get(("metrics", "admin"), failing)
+        assert cache.stats()["refreshing"] == 0
+        with pytest.raises(RuntimeError):
+            await cache.get(("metrics", "admin"), failing)
+        return cache, calls
+
+    cache, calls = run(scenario())
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_disconnected_client_does_not_cancel_the_shared_computation():
+    async def scenario():
+        cache, report = ReportCache(), Report(gate=True)
+        first = asyncio.create_task(cache.get(("metrics", "admin"), report))
+        second = asyncio.create_task(cache.get(("metrics", "admin"), report))
+        await report.started(1)
+        first.cancel()
+        await asyncio.sleep(0)
+        report.gate.set()
+        return cache, report, first, await second
+
+    cache, report, first, value = run(scenario())
+    assert first.cancelled()
+    assert value == 1
+    assert report.calls == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_clear_drops_entries_and_bumps_the_version():
+    async def scenario():
+        cache, report = ReportCache(), Report()
+        await cache.get(("metrics", "admin"), report)
+        cache.clear()
+        return cache, await cache.get(("metrics", "admin"), report)
+
+    cache, value = run(scenario())
+    assert value == 2
+    assert cache.stats()["version"] == 1
@@ -0,0 +1,77 @@
+from server import report_rollups_log_to_apply
+
+
+def entry(source_id, sign, kind="item"):
+    """Entrada do log como apply_report_rollup grava: (kind, id, sinal, contribuição)"""
+    return (kind, source_id, sign, ({"kind": kind, "source": source_id}, {"items": 1}))
+
+
+def applied(log, counted):
+    return [(contribution[0]["source"], sign) for contribution, sign in report_rollups_log_to_apply(log, counted)]
+
+
+def test_add_during_scan_of_a_fact_the_scan_counted_is_skipped():
+    # Check-out gravado antes de a varredura chegar ao documento: ele já está nas linhas novas
+    counted = {("item", "ic1")}
+    assert applied([entry("ic1", 1)], counted) == []
+    assert counted == {("item", "ic1")}
+
+
+def test_add_during_scan_of_a_fact_the_scan_missed_is_applied():
+    # Check-out gravado depois de a varredura passar pelo documento
+    counted = set()
+    assert applied([entry("ic2", 1)], counted) == [("ic2", 1)]
+    assert counted == {("item", "ic2")}
+
+
+def test_delete_during_scan_of_a_counted_fact_is_applied():
+    counted = {("item", "ic1"), ("item", "ic2")}
+    assert applied([entry("ic1", -1)], counted) == [("ic1", -1)]
+    assert counted == {("item", "ic2")}
+
+
+def test_delete_of_a_fact_the_scan_never_saw_is_skipped():
+    # Excluído antes de a varredura lê-lo: a contribuição nunca entrou nas linhas novas
+    counted = {("item", "ic2")}
+    assert applied([entry("ic1", -1)], counted) == []
+    assert counted == {("item", "ic2")}
+
+
+def test_add_then_delete_of_an_unscanned_fact_cancel_out():
+    counted = set()
+    assert applied([entry("ic1", 1), entry("ic1", -1)], counted) == [("ic1", 1), ("ic1", -1)]
+    assert counted == set()
+
+
+def test_delete_then_add_again_of_a_counted_fact():
+    # Check-out desfeito e refeito durante a reconstrução
+    counted = {("item", "ic1")}
+    assert applied([entry("ic1", -1), entry("ic1", 1)], counted) == [("ic1", -1), ("ic1", 1)]
+    assert counted == {("item", "ic1")}
+
+
+def test_duplicate_entries_are_applied_once():
+    counted = set()
+    assert applied([entry("ic1", 1), entry("ic1", 1), entry("ic1", -1), entry("ic1", -1)], counted) == [
+        ("ic1", 1), ("ic1", -1)
+    ]
+
+
+def test_facts_are_keyed_by_kind_and_id():
+    counted = {("item", "x1")}
+    assert applied([entry("x1", 1, kind="product"), entry("x1", 1)], counted) == [("x1", 1)]
+    assert counted == {("item", "x1"), ("product", "x1")}
+
+
+def test_entries_appended_while_replaying_are_consumed():
+    # Escritas que chegam durante os $inc da reaplicação entram no mesmo log
+    log, counted = [entry("ic1", 1)], set()
+    result = []
+    for contribution, sign in report_rollups_log_to_apply(log, counted):
+        result.append((contribution[0]["source"], sign))
+        if len(result) == 1:
+            log.append(entry("ic2", 1))
+            log.append(entry("ic1", -1))
+    assert result == [("ic1", 1), ("ic2", 1), ("ic1", -1)]
+    assert log == []
+    assert counted == {("item", "ic2")}